@@ -3,15 +3,174 @@ WaterCali - Water Flow Calibration System for SLF3S-1300F Flow Meter
 Designed for Raspberry Pi 4B with native I2C interface
 """
 
+import gc
 import time
+import asyncio
+import threading
+import fcntl
+import ctypes
+import struct
 import logging
 from typing import Optional, Tuple
 
+import numpy as np
+
 try:
     import smbus2
+    from smbus2 import i2c_msg
+    from smbus2.smbus2 import I2C_M_RD, I2C_RDWR, i2c_rdwr_ioctl_data
 except ImportError:
     print("Warning: smbus2 not installed. Install with: pip install smbus2")
     smbus2 = None
+    i2c_msg = None
+
+
+def _build_crc8_table(polynomial: int = 0x31) -> bytes:
+    """
+    Build the 256-entry lookup table for the Sensirion CRC-8 (x^8 + x^5 + x^4 + 1).
+    """
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ polynomial) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+
+# CRC-8 lookup table, used with init value 0xFF over each 2-byte data word.
+# The check stays in software: SMBus PEC (bus.pec) uses polynomial 0x07 over
+# the whole message including the address byte, and i2c-dev applies it to
+# SMBus transfers only, not to the I2C_RDWR reads used here.
+_CRC8_TABLE = _build_crc8_table()
+_CRC8_TABLE_NP = np.frombuffer(_CRC8_TABLE, dtype=np.uint8)
+
+# Big-endian signed 16-bit flow word at the start of a frame
+_UNPACK_FLOW = struct.Struct('>h').unpack_from
+
+
+def _read_flow_unavailable():
+    """
+    Stand-in for WaterCali.read_flow_fast() while the I2C bus is not open.
+    """
+    return None
+
+
+def _decode_flow_frames(frames, crc_table, flow_inv, flows_out, valid_out):
+    """
+    CRC-check and decode (n, 3) uint8 flow frames in a single fused pass.
+    Only run compiled, see _flow_frame_decoder().
+    """
+    for i in range(frames.shape[0]):
+        hi = np.int32(frames[i, 0])
+        lo = np.int32(frames[i, 1])
+        valid_out[i] = crc_table[crc_table[0xFF ^ hi] ^ lo] == frames[i, 2]
+        flow_raw = (hi << 8) | lo
+        if flow_raw > 32767:
+            flow_raw -= 65536
+        flows_out[i] = flow_raw * flow_inv
+
+
+_flow_decoder = None
+_flow_decoder_loaded = False
+
+
+def _flow_frame_decoder():
+    """
+    Get the numba-compiled _decode_flow_frames(). numba is imported on the
+    first call and the kernel compiled on its first use (then loaded from
+    numba's cache), so neither costs anything unless read_flow_batch() runs.
+    
+    Returns:
+        callable: Compiled kernel, or None if numba is not installed
+    """
+    global _flow_decoder, _flow_decoder_loaded
+    if not _flow_decoder_loaded:
+        try:
+            from numba import njit
+            _flow_decoder = njit(cache=True, boundscheck=False)(_decode_flow_frames)
+        except ImportError:
+            pass  # Optional: batch decoding falls back to numpy
+        _flow_decoder_loaded = True
+    return _flow_decoder
+
+
+class FlowBuffer:
+    """
+    Fixed-capacity ring buffer of flow samples stored as separate arrays.
+    
+    Timestamps (s) are kept as float64 and flow rates (mL/min) as float32.
+    When the buffer is full the writer wraps to the start and overwrites
+    the oldest samples.
+    """
+    
+    def __init__(self, capacity: int):
+        """
+        Initialize the FlowBuffer class.
+        
+        Args:
+            capacity (int): Maximum number of samples held
+        """
+        self.capacity = capacity
+        self.timestamps = np.empty(capacity, dtype=np.float64)
+        self.flows = np.empty(capacity, dtype=np.float32)
+        self.count = 0  # Total samples written since the last clear()
+    
+    @classmethod
+    def for_duration(cls, duration: float, sample_frequency: float) -> "FlowBuffer":
+        """
+        Create a buffer large enough for a fixed-rate acquisition, with a
+        little headroom so it never wraps.
+        
+        Args:
+            duration (float): Acquisition time in seconds
+            sample_frequency (float): Sampling rate in Hz
+        """
+        return cls(int(duration * sample_frequency) + 16)
+    
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+    
+    def append(self, timestamp: float, flow: float):
+        """
+        Store one sample, overwriting the oldest one if the buffer is full.
+        """
+        idx = self.count % self.capacity
+        self.timestamps[idx] = timestamp
+        self.flows[idx] = flow
+        self.count += 1
+    
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the buffered samples in chronological order.
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (timestamps, flows); views into the
+            buffer unless it has wrapped, copies otherwise
+        """
+        if self.count <= self.capacity:
+            return self.timestamps[:self.count], self.flows[:self.count]
+        head = self.count % self.capacity
+        return (np.concatenate((self.timestamps[head:], self.timestamps[:head])),
+                np.concatenate((self.flows[head:], self.flows[:head])))
+    
+    def latest(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get copies of the newest n samples in chronological order.
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (timestamps, flows), at most len(self) samples
+        """
+        n = min(n, len(self))
+        end = self.count % self.capacity
+        idx = np.arange(end - n, end) % self.capacity
+        return self.timestamps[idx], self.flows[idx]
+    
+    def clear(self):
+        """
+        Discard all buffered samples.
+        """
+        self.count = 0
 
 
 class WaterCali:
@@ -22,14 +181,45 @@ class WaterCali:
     Default I2C address is 0x08.
     """
     
+    __slots__ = (
+        'i2c_bus', 'bus', 'measuring', 'logger', '_log_warning', '_log_error',
+        '_batch_requests', '_ring', '_ring_lock', '_reader_thread', '_reader_stop',
+        '_msg_start', '_msg_stop', '_msg_reset',
+        '_msg_product_id_1', '_msg_product_id_2', '_msg_product_id_data', '_product_id_bytes',
+        '_flow_read', '_flow_rdwr', '_flow_data', '_flow_bytes', 'read_flow_fast',
+    )
+    
     # SLF3S-1300F I2C address (7-bit address)
     FLOW_METER_ADDRESS = 0x08
     
+    # I2C general call address, used for the soft reset
+    GENERAL_CALL_ADDRESS = 0x00
+    
+    # Linux i2c-dev limit on messages per I2C_RDWR transaction
+    I2C_RDWR_MAX_MSGS = 42
+    
+    # I2C fast mode clock supported by the SLF3S-1300F
+    I2C_FAST_MODE_HZ = 400000
+    
+    # Flow scale factor of the SLF3S-1300F, (mL/min)^-1, applied as a multiply
+    FLOW_SCALE_FACTOR = 500
+    _FLOW_INV = 1.0 / FLOW_SCALE_FACTOR
+    
+    # Datasheet timings in seconds
+    TSTART_S = 0.012  # First measurement available after the start command
+    TSTART_TIMEOUT_S = 0.05  # Give up waiting for the first frame after this
+    TWARMUP_S = 0.05  # Measurements reliable after the start command
+    TSTOP_S = 0.0005  # Sensor idle after the stop command
+    TRESET_S = 0.025  # Soft reset duration
+    
+    # acquire() gives up after this many failed reads in a row
+    MAX_READ_FAILURES = 25
+    
     # Command codes for SLF3S-1300F
     CMD_START_CONTINUOUS_MEASUREMENT = [0x36, 0x08]
     CMD_STOP_CONTINUOUS_MEASUREMENT = [0x3F, 0xF9]
     CMD_READ_MEASUREMENT = [0xE1, 0x02]
-    CMD_SOFT_RESET = [0x00, 0x06]
+    CMD_SOFT_RESET = [0x06]  # General call reset, sent to GENERAL_CALL_ADDRESS
     
     # Define command constants
     CMD_READ_PRODUCT_ID_1 = [0x36, 0x7C]  # First part of the Read Product Identifier command
@@ -45,10 +235,23 @@ class WaterCali:
         self.i2c_bus = i2c_bus
         self.bus = None
         self.measuring = False
+        self._batch_requests = {}  # Prebuilt read_flow_batch() requests by frame count
         
-        # Setup logging
-        logging.basicConfig(level=logging.INFO)
+        # Background sampling state (see start_background_sampling())
+        self._ring = None
+        self._ring_lock = threading.Lock()
+        self._reader_thread = None
+        self._reader_stop = threading.Event()
+        
+        # Replaced by the specialized reader once the bus is open
+        self.read_flow_fast = _read_flow_unavailable
+        
+        # Logging is configured by the application (see main())
         self.logger = logging.getLogger(__name__)
+        # Level checks cached for the read hot paths; reflects the logging
+        # configuration at construction time
+        self._log_warning = self.logger.isEnabledFor(logging.WARNING)
+        self._log_error = self.logger.isEnabledFor(logging.ERROR)
         
         if smbus2 is None:
             self.logger.error("smbus2 library not available. Please install it.")
@@ -56,13 +259,62 @@ class WaterCali:
             
         try:
             self.bus = smbus2.SMBus(self.i2c_bus)
-            self.logger.info(f"I2C bus {self.i2c_bus} initialized")
+            self.logger.info("I2C bus %s initialized", self.i2c_bus)
         except Exception as e:
-            self.logger.error(f"Failed to initialize I2C bus {self.i2c_bus}: {e}")
+            self.logger.error("Failed to initialize I2C bus %s: %s", self.i2c_bus, e)
+            return
+        
+        self.check_bus_clock()
+        
+        # Prebuilt command messages, dispatched with bus.i2c_rdwr()
+        addr = self.FLOW_METER_ADDRESS
+        self._msg_start = i2c_msg.write(addr, self.CMD_START_CONTINUOUS_MEASUREMENT)
+        self._msg_stop = i2c_msg.write(addr, self.CMD_STOP_CONTINUOUS_MEASUREMENT)
+        self._msg_reset = i2c_msg.write(self.GENERAL_CALL_ADDRESS, self.CMD_SOFT_RESET)
+        self._msg_product_id_1 = i2c_msg.write(addr, self.CMD_READ_PRODUCT_ID_1)
+        self._msg_product_id_2 = i2c_msg.write(addr, self.CMD_READ_PRODUCT_ID_2)
+        self._msg_product_id_data = i2c_msg.read(addr, 18)
+        self._product_id_bytes = memoryview(ctypes.cast(
+            self._msg_product_id_data.buf, ctypes.POINTER(ctypes.c_uint8 * 18)).contents).cast('B')
+        
+        # Prebuilt I2C_RDWR request for read_flow(), reused on every call.
+        # In continuous mode any master read returns the latest frame, so no
+        # command or pointer byte is written first.
+        self._flow_read = i2c_msg.read(self.FLOW_METER_ADDRESS, 3)
+        self._flow_rdwr = i2c_rdwr_ioctl_data.create(self._flow_read)
+        # View of the read buffer, filled in place by the ioctl
+        self._flow_data = ctypes.cast(self._flow_read.buf,
+                                      ctypes.POINTER(ctypes.c_uint8 * 3)).contents
+        self._flow_bytes = memoryview(self._flow_data).cast('B')
+        self.read_flow_fast = self._build_read_flow_fast()
+    
+    def check_bus_clock(self) -> Optional[int]:
+        """
+        Check the configured I2C bus clock from the device tree.
+        Logs a warning if the bus runs slower than I2C fast mode.
+        
+        Returns:
+            int: Bus clock in Hz, or None if not available (e.g. USB adapters)
+        """
+        path = f"/sys/class/i2c-adapter/i2c-{self.i2c_bus}/of_node/clock-frequency"
+        try:
+            with open(path, 'rb') as f:
+                clock_hz = struct.unpack('>I', f.read(4))[0]
+        except (OSError, struct.error):
+            return None
+        
+        if clock_hz < self.I2C_FAST_MODE_HZ:
+            self.logger.warning(
+                "I2C bus %s clocked at %s Hz; set dtparam=i2c_arm_baudrate=%s "
+                "in config.txt for faster reads", self.i2c_bus, clock_hz, self.I2C_FAST_MODE_HZ)
+        return clock_hz
     
     def soft_reset(self) -> bool:
         """
         Perform a soft reset of the SLF3S-1300F sensor.
+        Per the datasheet this is an I2C general call reset (0x06 sent to
+        address 0x00), which also resets any other device on the bus that
+        supports general call.
         
         Returns:
             bool: True if reset successful, False otherwise
@@ -72,17 +324,13 @@ class WaterCali:
             return False
         
         try:
-            self.bus.write_i2c_block_data(
-                self.FLOW_METER_ADDRESS,
-                self.CMD_SOFT_RESET[0],
-                [self.CMD_SOFT_RESET[1]]
-            )
-            time.sleep(0.1)  # Wait for reset to complete
+            self.bus.i2c_rdwr(self._msg_reset)
+            time.sleep(self.TRESET_S)  # Wait for reset to complete
             self.measuring = False
             self.logger.info("Soft reset completed")
             return True
         except Exception as e:
-            self.logger.error(f"Soft reset failed: {e}")
+            self.logger.error("Soft reset failed: %s", e)
             return False
         
     def test_i2c(self) -> bool:
@@ -93,58 +341,38 @@ class WaterCali:
             bool: True if connection successful, False otherwise
         """
         if self.bus is None:
-            print("I2C connection to flow meter failed - bus not initialized")
+            self.logger.error("I2C connection to flow meter failed - bus not initialized")
             return False
     
         try:
-            # Send the Read Product Identifier command using defined constants
-            self.bus.write_i2c_block_data(
-                self.FLOW_METER_ADDRESS, 
-                self.CMD_READ_PRODUCT_ID_1[0],  # First byte of the first command
-                [self.CMD_READ_PRODUCT_ID_1[1]]  # Second byte of the first command
-            )
-            time.sleep(0.01)  # Small delay between commands
-            self.bus.write_i2c_block_data(
-                self.FLOW_METER_ADDRESS, 
-                self.CMD_READ_PRODUCT_ID_2[0],  # First byte of the second command
-                [self.CMD_READ_PRODUCT_ID_2[1]]  # Second byte of the second command
-            )
-    
-            # Read 18 bytes of response data
-            data = self.bus.read_i2c_block_data(self.FLOW_METER_ADDRESS, 0x00, 18)
-    
-            # Extract product number (bytes 1-4)
-            product_number = (data[0] << 24) | (data[1] << 16) | (data[3] << 8) | data[4]
-    
-            # Extract serial number (bytes 7-14)
-            serial_number = (
-                (data[6] << 56) | (data[7] << 48) | (data[8] << 40) | (data[9] << 32) |
-                (data[10] << 24) | (data[11] << 16) | (data[12] << 8) | data[13]
-            )
+            # Send both Read Product Identifier commands and read the 18-byte
+            # response in a single repeated-START transaction
+            self.bus.i2c_rdwr(self._msg_product_id_1, self._msg_product_id_2,
+                              self._msg_product_id_data)
+            data = self._product_id_bytes
+    
+            # Every 2 data bytes are followed by a CRC byte; strip the CRCs and
+            # unpack the 32-bit product number and 64-bit serial number
+            words = b''.join([data[i:i + 2] for i in range(0, 18, 3)])
+            product_number, serial_number = struct.unpack('>IQ', words)
     
             # Log the product and serial numbers
-            print(f"Product Number: {product_number}")
-            print(f"Serial Number: {serial_number}")
-            self.logger.info(f"Product Number: {product_number}, Serial Number: {serial_number}")
+            self.logger.info("Product Number: %s, Serial Number: %s", product_number, serial_number)
     
             # If we get here without exception, connection is working
-            print("I2C connection to flow meter successful")
             self.logger.info("SLF3S-1300F flow meter detected and responding")
             return True
     
         except OSError as e:
             if e.errno == 121:  # Remote I/O error - device not found
-                print("I2C connection to flow meter failed - device not found")
                 self.logger.error("SLF3S-1300F not found on I2C bus")
                 self.soft_reset()
                 
             else:
-                print(f"I2C connection to flow meter failed - {e}")
-                self.logger.error(f"I2C communication error: {e}")
+                self.logger.error("I2C communication error: %s", e)
             return False
         except Exception as e:
-            print(f"I2C connection to flow meter failed - {e}")
-            self.logger.error(f"Unexpected error during I2C test: {e}")
+            self.logger.error("Unexpected error during I2C test: %s", e)
             return False
     
     def start_measure(self) -> bool:
@@ -154,34 +382,81 @@ class WaterCali:
         Returns:
             bool: True if measurement started successfully, False otherwise
         """
+        return self._start()[0]
+    
+    def start_and_read(self) -> Optional[float]:
+        """
+        Start continuous flow measurement and return the first sample.
+        The frame read at the end of the warm-up time is returned instead of
+        being discarded, saving a separate read_flow() call.
+        
+        Returns:
+            float: First flow rate in mL/min or None if error
+        """
+        started, flow = self._start()
+        if started and flow is None and self.measuring:
+            flow = self.read_flow()  # Already running, or first frame timed out
+        return flow
+    
+    def _start(self) -> Tuple[bool, Optional[float]]:
+        """
+        Send the start command and wait until the sensor delivers reliable
+        measurements.
+        
+        Returns:
+            tuple: (True if measurement is running, first flow rate in mL/min
+            or None if measurement was already running or no frame arrived)
+        """
         if self.bus is None:
             self.logger.error("Cannot start measurement - I2C bus not initialized")
-            return False
+            return False, None
             
         if self.measuring:
             self.logger.warning("Measurement already in progress")
-            return True
+            return True, None
             
         try:
             # Send start continuous measurement command
-            self.bus.write_i2c_block_data(
-                self.FLOW_METER_ADDRESS,
-                self.CMD_START_CONTINUOUS_MEASUREMENT[0],
-                [self.CMD_START_CONTINUOUS_MEASUREMENT[1]]
-            )
+            self.bus.i2c_rdwr(self._msg_start)
+            start_time = time.perf_counter()
             
-            # Wait a bit for the sensor to start
-            time.sleep(0.05)
+            # Wait out the start-up and warm-up time
+            flow = self._wait_first_frame(start_time)
+            if flow is None:
+                self.logger.warning("No valid flow frame within %s s of start", self.TSTART_TIMEOUT_S)
             
             self.measuring = True
             self.logger.info("Started continuous flow measurement")
-            print("Flow measurement started")
-            return True
+            return True, flow
             
         except Exception as e:
-            self.logger.error(f"Failed to start measurement: {e}")
-            print(f"Failed to start flow measurement: {e}")
-            return False
+            self.logger.error("Failed to start measurement: %s", e)
+            return False, None
+    
+    def _wait_first_frame(self, start_time: float) -> Optional[float]:
+        """
+        Wait for the first reliable flow frame after a start command: poll
+        from tSTART until the sensor returns a frame with a valid CRC, then
+        hold off until tWARMUP has passed since the command and read again.
+        
+        Args:
+            start_time (float): time.perf_counter() when the command was sent
+        
+        Returns:
+            float: Flow rate in mL/min at the end of the warm-up, or None if
+            no valid frame arrived in time
+        """
+        read = self.read_flow_fast  # Returns None while the sensor NACKs
+        time.sleep(self.TSTART_S)
+        while read() is None:
+            if time.perf_counter() - start_time >= self.TSTART_TIMEOUT_S:
+                return None
+            time.sleep(0.001)
+        
+        delay = start_time + self.TWARMUP_S - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return read()
     
     def stop_measure(self) -> bool:
         """
@@ -200,69 +475,459 @@ class WaterCali:
             
         try:
             # Send stop continuous measurement command
-            self.bus.write_i2c_block_data(
-                self.FLOW_METER_ADDRESS,
-                self.CMD_STOP_CONTINUOUS_MEASUREMENT[0],
-                [self.CMD_STOP_CONTINUOUS_MEASUREMENT[1]]
-            )
+            self.bus.i2c_rdwr(self._msg_stop)
             
-            # Wait a bit for the sensor to stop
-            time.sleep(0.05)
+            # Wait for the sensor to return to idle
+            time.sleep(self.TSTOP_S)
             
             self.measuring = False
             self.logger.info("Stopped continuous flow measurement")
-            print("Flow measurement stopped")
             return True
             
         except Exception as e:
-            self.logger.error(f"Failed to stop measurement: {e}")
-            print(f"Failed to stop flow measurement: {e}")
+            self.logger.error("Failed to stop measurement: %s", e)
             return False
     
-    def read_flow(self):
+    def read_flow(self) -> Optional[float]:
         """
-        Read flow and temperature values from the sensor.
+        Read the flow value from the sensor.
         Must be called after start_measure().
         
         Returns:
-            Tuple[float, float]: (flow_rate_ml_min, temperature_celsius) or None if error
+            float: Flow rate in mL/min or None if error
         """
         if self.bus is None:
-            self.logger.error("Cannot read flow - I2C bus not initialized")
+            if self._log_error:
+                self.logger.error("Cannot read flow - I2C bus not initialized")
             return None
             
         if not self.measuring:
-            self.logger.error("Cannot read flow - measurement not started")
+            if self._log_error:
+                self.logger.error("Cannot read flow - measurement not started")
             return None
             
         try:
-            # Read 3 bytes: 2 bytes flow + 1 CRC
-            data = self.bus.read_i2c_block_data(self.FLOW_METER_ADDRESS, 0x00, 3)
-            
-            # Extract flow data (first 2 bytes)
-            flow_raw = (data[0] << 8) | data[1]
-            # Convert to signed 16-bit
-            if flow_raw > 32767:
-                flow_raw -= 65536
+            # Read 3 bytes: 2 bytes flow + 1 CRC, straight into the
+            # preallocated buffer
+            fcntl.ioctl(self.bus.fd, I2C_RDWR, self._flow_rdwr)
+            data = self._flow_data
+            
+            # Verify the CRC of the flow word and drop corrupted frames
+            crc = _CRC8_TABLE[0xFF ^ data[0]]
+            crc = _CRC8_TABLE[crc ^ data[1]]
+            if crc != data[2]:
+                if self._log_warning:
+                    self.logger.warning("Flow frame CRC mismatch - sample dropped")
+                return None
+            
+            # Extract flow data (first 2 bytes, signed 16-bit)
+            flow_raw = _UNPACK_FLOW(data)[0]
                 
             # Convert to physical units based on datasheet
             # Flow: scaling factor and offset depend on calibration
-            flow_ml_min = flow_raw / 500  # Scaling for SLF3S-1300F
+            flow_ml_min = flow_raw * self._FLOW_INV  # Scaling for SLF3S-1300F
             
             return (flow_ml_min)
             
         except Exception as e:
-            self.logger.error(f"Failed to read flow data: {e}")
+            if self._log_error:
+                self.logger.error("Failed to read flow data: %s", e)
+            return None
+    
+    def _build_read_flow_fast(self):
+        """
+        Build read_flow_fast(): read_flow() specialized for this instance, with
+        the bus fd, prebuilt request, buffer view, CRC table and scale factor
+        bound as default arguments. It skips the bus/measuring checks and
+        logging, so only call it while measurement is running.
+        
+        Returns:
+            callable: Function returning the flow rate in mL/min, or None if the
+            read failed or the frame CRC did not match
+        """
+        def read_flow_fast(_ioctl=fcntl.ioctl, _fd=self.bus.fd, _req=I2C_RDWR,
+                           _rdwr=self._flow_rdwr, _data=self._flow_data,
+                           _table=_CRC8_TABLE, _unpack=_UNPACK_FLOW,
+                           _inv=self._FLOW_INV):
+            try:
+                _ioctl(_fd, _req, _rdwr)
+            except OSError:
+                return None
+            if _table[_table[0xFF ^ _data[0]] ^ _data[1]] != _data[2]:
+                return None
+            return _unpack(_data)[0] * _inv
+        return read_flow_fast
+    
+    def read_flow_raw_into(self, mv: memoryview, offset: int = 0) -> int:
+        """
+        Read one raw flow frame (flow hi, flow lo, CRC) into a caller-supplied
+        buffer, without decoding. Lets a sink that forwards raw samples pack
+        many frames into one pre-sized buffer; the CRC byte is kept so the
+        receiver can verify and scale (see FLOW_SCALE_FACTOR) each frame.
+        Must be called after start_measure().
+        
+        Args:
+            mv (memoryview): Writable byte buffer (e.g. memoryview(bytearray(...)))
+            offset (int): Byte offset of the frame in mv
+        
+        Returns:
+            int: Number of bytes written (3), or 0 if error
+        """
+        if self.bus is None:
+            if self._log_error:
+                self.logger.error("Cannot read flow - I2C bus not initialized")
+            return 0
+            
+        if not self.measuring:
+            if self._log_error:
+                self.logger.error("Cannot read flow - measurement not started")
+            return 0
+        
+        # Check the buffer first so a bad one does not discard a frame
+        if mv.readonly or mv.format != 'B' or mv.ndim != 1:
+            if self._log_error:
+                self.logger.error("Cannot read flow - buffer must be a writable 1-D byte memoryview")
+            return 0
+        
+        if not 0 <= offset <= len(mv) - 3:
+            if self._log_error:
+                self.logger.error("Cannot read flow - buffer has no room for a frame at offset %s", offset)
+            return 0
+        
+        try:
+            fcntl.ioctl(self.bus.fd, I2C_RDWR, self._flow_rdwr)
+            mv[offset:offset + 3] = self._flow_bytes
+            return 3
+        except Exception as e:
+            if self._log_error:
+                self.logger.error("Failed to read flow data: %s", e)
+            return 0
+    
+    async def read_flow_async(self) -> Optional[float]:
+        """
+        Read the flow value without blocking the event loop.
+        The I2C transaction runs in a worker thread; calls must not overlap
+        with other reads on the same instance.
+        
+        Returns:
+            float: Flow rate in mL/min or None if error
+        """
+        return await asyncio.to_thread(self.read_flow)
+    
+    async def stream(self, queue: asyncio.Queue, sample_frequency: float):
+        """
+        Push (timestamp_s, flow_ml_min) samples into an asyncio queue at a fixed
+        rate until cancelled. Must be called after start_measure().
+        
+        Wakeups are scheduled on absolute loop.time() deadlines so timing
+        errors do not accumulate; timestamps use the same monotonic clock.
+        
+        Args:
+            queue (asyncio.Queue): Queue receiving the samples
+            sample_frequency (float): Sampling rate in Hz
+        """
+        loop = asyncio.get_running_loop()
+        sample_interval = 1.0 / sample_frequency
+        next_measurement_time = loop.time()
+        
+        while True:
+            wakeup = loop.create_future()
+            handle = loop.call_at(next_measurement_time, wakeup.set_result, None)
+            try:
+                await wakeup
+            finally:
+                handle.cancel()
+            
+            timestamp = loop.time()
+            flow = await self.read_flow_async()
+            if flow is not None:
+                await queue.put((timestamp, flow))
+            next_measurement_time += sample_interval
+    
+    def read_flow_batch(self, n: int):
+        """
+        Read n consecutive flow frames in a single I2C transaction.
+        Must be called after start_measure().
+        
+        Each frame is its own read message (repeated START in between), since
+        a longer single read would continue into the temperature word rather
+        than return the next flow frame. The sensor reports the average since
+        the last readout and the reads run back to back, so the frames are
+        repeated readings of the same measurement (e.g. for averaging), not
+        evenly spaced samples; the batch therefore gets a single timestamp.
+        Do not use this for fixed-rate sampling, which goes through read_flow().
+        
+        Args:
+            n (int): Number of frames to read, at most I2C_RDWR_MAX_MSGS
+        
+        Returns:
+            Tuple[float, np.ndarray]: (timestamp_s, flows_ml_min) with the flows of
+            the frames that passed the CRC check, timestamp on the time.monotonic()
+            clock at the middle of the transaction; or None if error
+        """
+        if self.bus is None:
+            if self._log_error:
+                self.logger.error("Cannot read flow - I2C bus not initialized")
+            return None
+            
+        if not self.measuring:
+            if self._log_error:
+                self.logger.error("Cannot read flow - measurement not started")
+            return None
+        
+        if not 0 < n <= self.I2C_RDWR_MAX_MSGS:
+            if self._log_error:
+                self.logger.error("Cannot read %s flow frames in one transaction", n)
+            return None
+            
+        try:
+            request = self._batch_requests.get(n)
+            if request is None:
+                request = self._batch_requests[n] = self._build_batch_request(n)
+            rdwr, frames, flow_words, flows, valid = request
+            
+            # n 3-byte frame reads, no pointer write needed in continuous mode
+            start_time = time.monotonic()
+            fcntl.ioctl(self.bus.fd, I2C_RDWR, rdwr)
+            end_time = time.monotonic()
+            
+            # Verify the CRC of every flow word, decode the big-endian signed
+            # flow words and scale for SLF3S-1300F
+            decode = _flow_frame_decoder()
+            if decode is not None:
+                decode(frames, _CRC8_TABLE_NP, self._FLOW_INV, flows, valid)
+            else:
+                crc = _CRC8_TABLE_NP[_CRC8_TABLE_NP[0xFF ^ frames[:, 0]] ^ frames[:, 1]]
+                np.equal(crc, frames[:, 2], out=valid)
+                # Scale in float64 and round once on store, as the kernel does
+                np.multiply(flow_words, self._FLOW_INV, out=flows)
+            
+            # Drop corrupted frames
+            if not valid.all():
+                if self._log_warning:
+                    self.logger.warning("%s flow frame CRC mismatch(es) - samples dropped", n - int(valid.sum()))
+            
+            return 0.5 * (start_time + end_time), flows[valid]
+            
+        except Exception as e:
+            if self._log_error:
+                self.logger.error("Failed to read flow data: %s", e)
             return None
     
+    def _build_batch_request(self, n: int):
+        """
+        Build a reusable I2C_RDWR request of n 3-byte reads into one buffer.
+        
+        Returns:
+            tuple: (ioctl request, (n, 3) uint8 frame view, strided big-endian
+            int16 view of the flow words, float32 flow output, bool CRC-valid
+            output); the views share the request's read buffer
+        """
+        raw = (ctypes.c_uint8 * (3 * n))()
+        msgs = (i2c_msg * n)()
+        for i in range(n):
+            msgs[i].addr = self.FLOW_METER_ADDRESS
+            msgs[i].flags = I2C_M_RD
+            msgs[i].len = 3
+            msgs[i].buf = ctypes.cast(ctypes.addressof(raw) + 3 * i, ctypes.POINTER(ctypes.c_char))
+        rdwr = i2c_rdwr_ioctl_data(msgs=msgs, nmsgs=n)
+        # The messages hold raw pointers only; the numpy views keep the buffer alive
+        frames = np.frombuffer(raw, dtype=np.uint8).reshape(n, 3)
+        flow_words = np.ndarray((n,), dtype='>i2', buffer=raw, strides=(3,))
+        flows = np.empty(n, dtype=np.float32)
+        valid = np.empty(n, dtype=bool)
+        return rdwr, frames, flow_words, flows, valid
+    
+    def acquire(self, duration: float, sample_frequency: float, buffer: FlowBuffer) -> int:
+        """
+        Sample the flow rate at a fixed rate into a buffer.
+        Must be called after start_measure(). Sampling stops after the given
+        duration or once the buffer is full.
+        
+        Args:
+            duration (float): Acquisition time in seconds
+            sample_frequency (float): Average sampling rate in Hz
+            buffer (FlowBuffer): Buffer receiving (timestamp_s, flow_ml_min) samples,
+                timestamps relative to the start of the acquisition
+        
+        Returns:
+            int: Number of samples acquired
+        
+        Raises:
+            OSError: After MAX_READ_FAILURES consecutive failed reads (e.g. sensor
+                disconnected); the samples read until then stay in the buffer
+        """
+        # Checked once here; the loop then uses the unchecked read_flow_fast()
+        if self.bus is None or not self.measuring:
+            self.logger.error("Cannot acquire - measurement not started")
+            return 0
+        
+        sample_interval = 1.0 / sample_frequency  # Time between samples in seconds
+        capacity = buffer.capacity
+        start_count = buffer.count
+        
+        # Bind hot-loop lookups to locals
+        _time = time.monotonic
+        _sleep = time.sleep
+        _read = self.read_flow_fast
+        _append = buffer.append
+        
+        start_time = _time()
+        next_measurement_time = start_time
+        failures = 0
+        
+        # Keep the cyclic garbage collector from pausing the sampling loop;
+        # the sample storage itself is preallocated by the buffer
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            while buffer.count - start_count < capacity:
+                # Sleep until the next scheduled sample (absolute deadline)
+                delay = next_measurement_time - _time()
+                if delay > 0:
+                    _sleep(delay)
+            
+                current_time = _time()
+                if current_time - start_time >= duration:
+                    break
+            
+                # Read flow data; a failed read skips its sample slot
+                result = _read()
+                next_measurement_time += sample_interval
+                if result is not None:
+                    _append(current_time - start_time, result)
+                    failures = 0
+                else:
+                    failures += 1
+                    if failures >= self.MAX_READ_FAILURES:
+                        raise OSError(f"Flow meter stopped responding after {failures} "
+                                      "consecutive failed reads")
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        
+        return buffer.count - start_count
+    
+    def start_background_sampling(self, sample_frequency: float = 500,
+                                  capacity: int = 1024) -> bool:
+        """
+        Start continuous measurement and sample it on a background thread into
+        a ring buffer, so several consumers can pull recent history through
+        get_recent() without extra I2C traffic. Do not call the read methods
+        directly while background sampling is running. The thread gives up
+        after MAX_READ_FAILURES consecutive failed reads; call
+        stop_background_sampling() to end the measurement either way.
+        
+        Args:
+            sample_frequency (float): Average sampling rate in Hz
+            capacity (int): Number of samples kept in the ring buffer
+        
+        Returns:
+            bool: True if sampling started successfully, False otherwise
+        """
+        if self._reader_thread is not None:
+            self.logger.warning("Background sampling already running")
+            return True
+        
+        # The thread must own the measurement it samples
+        if self.measuring:
+            self.logger.error("Cannot start background sampling - measurement already in progress")
+            return False
+        
+        if not self.start_measure():
+            return False
+        
+        self._ring = FlowBuffer(capacity)
+        self._reader_stop.clear()
+        self._reader_thread = threading.Thread(
+            target=self._reader_loop, args=(sample_frequency,), daemon=True)
+        self._reader_thread.start()
+        self.logger.info("Started background sampling at %s Hz", sample_frequency)
+        return True
+    
+    def stop_background_sampling(self):
+        """
+        Stop the background sampling thread and the continuous measurement.
+        The ring buffer stays readable through get_recent().
+        """
+        if self._reader_thread is None:
+            return
+        
+        self._reader_stop.set()
+        self._reader_thread.join()
+        self._reader_thread = None
+        self.stop_measure()
+        self.logger.info("Stopped background sampling")
+    
+    def get_recent(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the newest n background samples.
+        
+        Args:
+            n (int): Number of samples requested
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Copies of (timestamps_s, flows_ml_min) in
+            chronological order, timestamps on the time.monotonic() clock; fewer
+            than n samples if not enough have been collected
+        """
+        if self._ring is None:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float32)
+        
+        with self._ring_lock:
+            return self._ring.latest(n)
+    
+    def _reader_loop(self, sample_frequency: float):
+        """
+        Background thread body: sample at a fixed rate into the ring buffer
+        until stop_background_sampling() is called or the sensor stops
+        responding.
+        """
+        read_interval = 1.0 / sample_frequency  # Time between reads in seconds
+        
+        # Bind hot-loop lookups to locals; the ring buffer is fixed for the
+        # lifetime of the thread
+        _time = time.monotonic
+        _stopped = self._reader_stop.is_set
+        _wait = self._reader_stop.wait
+        _read = self.read_flow_fast  # Measurement is running, see start_background_sampling()
+        _append = self._ring.append
+        ring_lock = self._ring_lock
+        
+        next_read_time = _time()
+        failures = 0
+        
+        while not _stopped():
+            # Sleep until the next scheduled read, waking early on stop
+            delay = next_read_time - _time()
+            if delay > 0 and _wait(delay):
+                break
+            
+            timestamp = _time()
+            flow = _read()
+            if flow is not None:
+                with ring_lock:
+                    _append(timestamp, flow)
+                failures = 0
+            else:
+                failures += 1
+                if failures >= self.MAX_READ_FAILURES:
+                    self.logger.error("Background sampling stopped after %s consecutive failed reads", failures)
+                    break
+            next_read_time += read_interval
+    
     def close(self):
         """
         Clean up resources and close I2C connection.
         """
+        self.stop_background_sampling()
+        
         if self.measuring:
             self.stop_measure()
             
         if self.bus is not None:
+            # The fast reader holds the raw fd, which the OS may reuse
+            self.read_flow_fast = _read_flow_unavailable
             self.bus.close()
             self.logger.info("I2C bus closed")
 
@@ -279,52 +944,26 @@ def main():
         
         if water_cali.start_measure():
             print("Starting data collection...")
-            start_time = time.time()
-            measurement_count = 0
-            data_buffer = []  # Buffer to store all measurements
-            next_measurement_time = start_time
+            data_buffer = FlowBuffer.for_duration(400.0, 500)  # Buffer to store all measurements
             
             try:
-                while time.time() - start_time < 400.0:  # Run for 400 seconds
-                    current_time = time.time()
-                    
-                    # Only measure if we've reached the next scheduled time
-                    if current_time >= next_measurement_time:
-                        # Read flow data
-                        result = water_cali.read_flow()
-                        if result:
-                            flow = result
-                            timestamp_ms = int((current_time - start_time) * 1000)
-                            
-                            # Buffer data instead of writing immediately
-                            data_buffer.append([timestamp_ms, flow])  # Use list for speed
-                            
-                            measurement_count += 1
-                            next_measurement_time += 0.002  # Schedule next measurement in 2ms (500Hz)
-                    
-                    # Small sleep to prevent busy waiting and allow other processes
-                    else:
-                        time.sleep(0.0001)  # 0.1ms sleep when not measuring
-                        
+                # Run for 400 seconds at 500Hz
+                water_cali.acquire(400.0, 500, data_buffer)
             except KeyboardInterrupt:
                 print("\nMeasurement interrupted by user")
+            except OSError as e:
+                print(f"Measurement aborted: {e}")
             
+            measurement_count = len(data_buffer)
             print(f"Data collection complete. Total measurements: {measurement_count}")
             print(f"Actual sampling rate: {measurement_count/400.0:.1f} Hz")
             print("Writing data to CSV file...")
             
             # Write all buffered data to CSV at once
-            with open('flow_data.csv', 'w', newline='') as csvfile:
-                fieldnames = ['timestamp_ms', 'flow_rate_ml_min']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                
-                # Convert list data back to dict format for CSV writing
-                for data_point in data_buffer:
-                    writer.writerow({
-                        'timestamp_ms': data_point[0],
-                        'flow_rate_ml_min': data_point[1],
-                    })
+            timestamps, flows = data_buffer.arrays()
+            np.savetxt('flow_data.csv', np.column_stack((timestamps * 1000, flows)),
+                       fmt=['%d', '%.3f'], delimiter=',',
+                       header='timestamp_ms,flow_rate_ml_min', comments='')
             
             print(f"Data saved to flow_data.csv")
             
@@ -338,4 +977,5 @@ def main():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main()
@@ -4,16 +4,28 @@ Water Calibration Server - ZMQ Interface
 Provides a ZMQ req/reply server for water flow measurement and volume calculation.
 """
 
+import os
 import zmq
 import socket
-import time
-import re
+import logging
+import math
 import threading
-from I2C_SLF3S_1300F import WaterCali
+import numpy as np
+from I2C_SLF3S_1300F import WaterCali, FlowBuffer
 
 # Global variables
 sample_frequency = 500  # Hz
 vol_queue = None  # Stores volume in milliliters (mL)
+_sensor = None  # Shared WaterCali instance, opened once in start_server()
+_sensor_lock = threading.Lock()  # Serializes measurements on the shared sensor
+acquisition_cpu = 2  # CPU core reserved for the sampling thread
+acquisition_priority = 80  # SCHED_FIFO priority of the sampling thread
+server_cpu = 3  # CPU core for the ZMQ server / integration thread
+
+# Pre-encoded fixed replies
+_ERR_INVALID_FORMAT = b"error: Invalid measure command format"
+_ERR_NOT_POSITIVE = b"error: Duration must be positive"
+_ERR_UNKNOWN = b"error: Unknown command"
 
 def get_local_ip():
     """Get the local IP address of the machine"""
@@ -35,77 +47,110 @@ def parse_measure_command(message):
     Returns:
         float: Duration in seconds or None if parsing failed
     """
-    # Match pattern: 'water.measure = duration'
-    match = re.match(r'water\.measure\s*=\s*(\d+(?:\.\d+)?)', message.strip())
-    if match:
+    # Split pattern: 'water.measure = duration'
+    command, separator, value = message.partition('=')
+    if not separator or command.strip() != 'water.measure':
+        return None
+    try:
+        duration = float(value)
+    except ValueError:
+        return None
+    # Reject nan/inf, which float() accepts but cannot bound a measurement
+    if not math.isfinite(duration):
+        return None
+    return duration
+
+def set_thread_scheduling(cpu, priority=None):
+    """
+    Pin the calling thread to a CPU core and optionally make it SCHED_FIFO.
+    Best effort: skipped with a warning on unsupported systems or without
+    CAP_SYS_NICE.
+    
+    Args:
+        cpu (int): CPU core index
+        priority (int): SCHED_FIFO priority, or None to keep the default policy
+    """
+    try:
+        if cpu < os.cpu_count():
+            os.sched_setaffinity(0, {cpu})
+    except (AttributeError, OSError) as e:
+        print(f"Warning: Could not pin thread to CPU {cpu}: {e}")
+    
+    if priority is not None:
         try:
-            return float(match.group(1))
-        except ValueError:
-            return None
-    return None
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        except (AttributeError, OSError) as e:
+            print(f"Warning: Could not set SCHED_FIFO priority {priority}: {e}")
+
+def acquisition_worker(sensor, duration, samples, result):
+    """
+    Sampling thread: sample the flow meter into the buffer.
+    
+    Args:
+        sensor (WaterCali): Sensor with measurement started
+        duration (float): Measurement duration in seconds
+        samples (FlowBuffer): Buffer receiving the samples
+        result (dict): Receives 'count' or 'error'
+    """
+    try:
+        set_thread_scheduling(acquisition_cpu, acquisition_priority)
+        result['count'] = sensor.acquire(duration, sample_frequency, samples)
+    except Exception as e:
+        result['error'] = e
 
-def perform_water_measurement(duration):
+def perform_water_measurement(duration, sensor):
     """
     Perform water flow measurement for the specified duration
+    
+    Args:
+        duration (float): Measurement duration in seconds
+        sensor (WaterCali): Open sensor instance shared across requests
     """
+    with _sensor_lock:
+        return _measure_volume(duration, sensor)
+
+def _measure_volume(duration, sensor):
+    """Run one measurement on the shared sensor; caller holds _sensor_lock"""
     global vol_queue
     
-    water_cali = WaterCali()
-    
     try:
-        # Test I2C connection
-        if not water_cali.test_i2c():
-            return False, "error: I2C connection failed", None
-        
         # Start measurement
-        if not water_cali.start_measure():
-            return False, "error: Failed to start measurement", None
+        if not sensor.start_measure():
+            return False, "error: Failed to start measurement"
         
-        # Data collection
-        start_time = time.time()
-        measurement_count = 0
-        flow_data = []
-        next_measurement_time = start_time
-        sample_interval = 1.0 / sample_frequency  # Time between samples in seconds
+        # Data collection into a buffer sized for the whole measurement
+        samples = FlowBuffer.for_duration(duration, sample_frequency)
         
         print(f"Starting {duration}s measurement at {sample_frequency}Hz...")
         
-        while time.time() - start_time < duration:
-            current_time = time.time()
-            
-            # Only measure if we've reached the next scheduled time
-            if current_time >= next_measurement_time:
-                # Read flow data
-                result = water_cali.read_flow()
-                if result is not None:
-                    flow_ml_min = result
-                    timestamp = current_time - start_time
-                    flow_data.append((timestamp, flow_ml_min))
-                    measurement_count += 1
-                    next_measurement_time += sample_interval
-                else:
-                    print("Warning: Failed to read flow data")
-            else:
-                # Small sleep to prevent busy waiting
-                time.sleep(0.0001)
+        # Sample on a dedicated high-priority thread and wait for it here
+        result = {}
+        acquisition_thread = threading.Thread(
+            target=acquisition_worker,
+            args=(sensor, duration, samples, result),
+            daemon=True)
+        acquisition_thread.start()
+        acquisition_thread.join()
+        if 'error' in result:
+            raise result['error']
+        measurement_count = result['count']
         
         # Stop measurement
-        water_cali.stop_measure()
+        sensor.stop_measure()
         
         # Calculate total volume
-        if len(flow_data) < 2:
-            return False, "error: Insufficient data collected", None
-        
-        # Integrate flow rate to get total volume
-        total_volume_ml = 0.0
-        for i in range(1, len(flow_data)):
-            # Get time difference in minutes
-            dt_min = (flow_data[i][0] - flow_data[i-1][0]) / 60.0
-            # Average flow rate between two points (mL/min)
-            avg_flow = (flow_data[i][1] + flow_data[i-1][1]) / 2.0
-            # Volume increment in mL
-            dv_ml = avg_flow * dt_min
-            total_volume_ml += dv_ml
+        if measurement_count < 2:
+            return False, "error: Insufficient data collected"
+        
+        # A volume over part of the duration is not a valid calibration
+        # result; reject runs whose samples do not reach both ends
+        timestamps, flows = samples.arrays()
+        max_edge_gap = 2.0 / sample_frequency
+        if timestamps[0] > max_edge_gap or duration - timestamps[-1] > max_edge_gap:
+            return False, "error: Samples do not cover the measurement duration"
+        
+        # Integrate flow rate (mL/min) over time (s) with the trapezoidal rule
+        total_volume_ml = float(np.trapz(flows, timestamps)) / 60.0
         
         # Store in global queue
         vol_queue = total_volume_ml
@@ -118,7 +163,9 @@ def perform_water_measurement(duration):
     except Exception as e:
         return False, f"error: {str(e)}"
     finally:
-        water_cali.close()
+        # Leave the bus open for the next request, only end the measurement
+        if sensor.measuring:
+            sensor.stop_measure()
 
 def handle_message(message):
     """
@@ -128,7 +175,7 @@ def handle_message(message):
         message (str): The incoming message string
         
     Returns:
-        str: Response message
+        bytes: Encoded response message
     """
     global vol_queue
     
@@ -138,25 +185,35 @@ def handle_message(message):
     if message.startswith('water.measure'):
         duration = parse_measure_command(message)
         if duration is None:
-            return "error: Invalid measure command format"
+            return _ERR_INVALID_FORMAT
         
         if duration <= 0:
-            return "error: Duration must be positive"
+            return _ERR_NOT_POSITIVE
         
         # Perform measurement in a separate thread to avoid blocking
-        success, volume = perform_water_measurement(duration)
+        success, volume = perform_water_measurement(duration, _sensor)
         if success:
-            return volume
+            return str(volume).encode()
         else:
             print(f"Measurement failed: {volume}")
-            return volume
+            return volume.encode()
             
     
     else:
-        return "error: Unknown command"
+        return _ERR_UNKNOWN
 
 def start_server():
     """Start the ZMQ req/reply server"""
+    global _sensor
+    
+    # Keep the server thread off the core used for sampling
+    set_thread_scheduling(server_cpu)
+    
+    # Open the flow meter once and keep the I2C bus open for all requests
+    _sensor = WaterCali()
+    if not _sensor.test_i2c():
+        print("Warning: I2C connection to flow meter failed")
+    
     # Get local IP address
     local_ip = get_local_ip()
     port = 3200
@@ -164,6 +221,9 @@ def start_server():
     # Set up ZMQ context and socket
     context = zmq.Context()
     socket_zmq = context.socket(zmq.REP)
+    # Don't block shutdown on unsent replies; queue at most one request
+    socket_zmq.setsockopt(zmq.LINGER, 0)
+    socket_zmq.setsockopt(zmq.RCVHWM, 1)
     
     try:
         # Bind to the local IP and port
@@ -171,27 +231,27 @@ def start_server():
         socket_zmq.bind(bind_address)
         print(f"Water calibration server listening on {bind_address}")
         
+        # Block in the kernel until a request arrives; the timeout only
+        # bounds how long Ctrl-C can take to be noticed
+        poller = zmq.Poller()
+        poller.register(socket_zmq, zmq.POLLIN)
+        
         while True:
+            if not poller.poll(1000):
+                continue
+            
             try:
-                # Wait for next request from client
-                message = socket_zmq.recv_string(zmq.NOBLOCK)
+                # Receive the pending request from client
+                message = socket_zmq.recv_string()
                 print(f"Received request: {message}")
                 
                 # Process the message
                 response = handle_message(message)
-                print(f"Sending response: {response}")
+                print(f"Sending response: {response.decode()}")
                 
                 # Send reply back to client
-                socket_zmq.send_string(str(response))
+                socket_zmq.send(response)
                 
-            except zmq.Again:
-                # No message available, continue polling
-                try:
-                    time.sleep(0.001)
-                except KeyboardInterrupt:
-                    print("\nShutting down server...")
-                    break
-                continue
             except Exception as e:
                 print(f"Error handling request: {e}")
                 try:
@@ -207,7 +267,9 @@ def start_server():
     finally:
         socket_zmq.close()
         context.term()
+        _sensor.close()
         print("Server stopped")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     start_server()
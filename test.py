@@ -1,6 +1,8 @@
-from I2C_SLF3S_1300F import WaterCali
-import csv
-import time
+from I2C_SLF3S_1300F import WaterCali, FlowBuffer
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
 
 water_cali = WaterCali()
 
@@ -10,52 +12,26 @@ if water_cali.test_i2c():
     
     if water_cali.start_measure():
         print("Starting data collection...")
-        start_time = time.time()
-        measurement_count = 0
-        data_buffer = []  # Buffer to store all measurements
-        next_measurement_time = start_time
+        data_buffer = FlowBuffer.for_duration(400.0, 500)  # Buffer to store all measurements
         
         try:
-            while time.time() - start_time < 400.0:  # Run for 400 seconds
-                current_time = time.time()
-                
-                # Only measure if we've reached the next scheduled time
-                if current_time >= next_measurement_time:
-                    # Read flow data
-                    result = water_cali.read_flow()
-                    if result:
-                        flow = result
-                        timestamp_ms = int((current_time - start_time) * 1000)
-                        
-                        # Buffer data instead of writing immediately
-                        data_buffer.append([timestamp_ms, flow])  # Use list for speed
-                        
-                        measurement_count += 1
-                        next_measurement_time += 0.002  # Schedule next measurement in 2ms (500Hz)
-                
-                # Small sleep to prevent busy waiting and allow other processes
-                else:
-                    time.sleep(0.0001)  # 0.1ms sleep when not measuring
-                    
+            # Run for 400 seconds at 500Hz
+            water_cali.acquire(400.0, 500, data_buffer)
         except KeyboardInterrupt:
             print("\nMeasurement interrupted by user")
+        except OSError as e:
+            print(f"Measurement aborted: {e}")
         
+        measurement_count = len(data_buffer)
         print(f"Data collection complete. Total measurements: {measurement_count}")
         print(f"Actual sampling rate: {measurement_count/400.0:.1f} Hz")
         print("Writing data to CSV file...")
         
         # Write all buffered data to CSV at once
-        with open('flow_data.csv', 'w', newline='') as csvfile:
-            fieldnames = ['timestamp_ms', 'flow_rate_ml_min']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            # Convert list data back to dict format for CSV writing
-            for data_point in data_buffer:
-                writer.writerow({
-                    'timestamp_ms': data_point[0],
-                    'flow_rate_ml_min': data_point[1],
-                })
+        timestamps, flows = data_buffer.arrays()
+        np.savetxt('flow_data.csv', np.column_stack((timestamps * 1000, flows)),
+                   fmt=['%d', '%.3f'], delimiter=',',
+                   header='timestamp_ms,flow_rate_ml_min', comments='')
         
         print(f"Data saved to flow_data.csv")
         